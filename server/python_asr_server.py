@@ -1,4 +1,8 @@
+import json
 import os
+import random
+import time
+from functools import lru_cache, wraps
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
@@ -18,24 +22,100 @@ Usage:
 
 load_dotenv(override=True)
 
+DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "sk-dfb5d9295ee94adeafc438d18c7d4900")
+DASHSCOPE_COMPATIBLE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+ASR_MODEL = "qwen3-asr-flash"
+LLM_MODEL = "qwen-flash"
+
+DIAGNOSE_PROMPT = "你是语法检测人员，帮忙找语法/用词问题并给出简短建议。输出每题：问题类型、问题解析（最多3条，简明短句），总体建议一段，最后给一个最终修改之后的答案，叫做‘答案’。格式用Markdown。"
+GRAM_CHECK_PROMPT = (
+  "请作为HSKK口语考官，用中文检查回答的语法/用词问题。"
+  "务必只输出严格的JSON对象，字段包括："
+  "“问题” (回答的原文), “问题类型” (概括错误类别，如语法/用词/结构/流畅度)，"
+  "“问题解析” (简短说明错误点并给出如何改进), “优化表达” (给出修改后的更自然答案)。"
+  "不要输出多余文本。"
+)
+
 app = Flask(__name__)
 CORS(app)
 
 
+@lru_cache(maxsize=None)
+def get_llm_client(api_key):
+  # One client per key so its underlying connection pool (keep-alive) is
+  # reused across requests instead of re-doing the TCP/TLS handshake.
+  return OpenAI(
+    api_key=api_key,
+    base_url=DASHSCOPE_COMPATIBLE_BASE_URL,
+  )
+
+
+def chat_completion(api_key, system_prompt, user_content, **kwargs):
+  """Run one non-streaming LLM_MODEL chat turn and return the reply text."""
+  completion = get_llm_client(api_key).chat.completions.create(
+    model=LLM_MODEL,
+    messages=[
+      {"role": "system", "content": system_prompt},
+      {"role": "user", "content": user_content},
+    ],
+    stream=False,
+    **kwargs,
+  )
+  return completion.choices[0].message.content
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_MESSAGE_HINTS = ("rate limit", "quota", "throttl")
+
+
+def is_retryable(resp):
+  status = getattr(resp, "status_code", 200)
+  if status == 200:
+    return False
+  if status in RETRYABLE_STATUS_CODES:
+    return True
+  # DashScope also reports throttling via code/message (e.g. "Throttling.RateQuota")
+  detail = f"{getattr(resp, 'code', '') or ''} {getattr(resp, 'message', '') or ''}".lower()
+  return any(hint in detail for hint in RETRYABLE_MESSAGE_HINTS)
+
+
+def call_with_retry(fn, max_attempts=3, base_delay=0.5, max_delay=8.0):
+  """Call ``fn`` and retry throttled/5xx DashScope responses with jittered backoff."""
+  for attempt in range(max_attempts):
+    resp = fn()
+    if not is_retryable(resp) or attempt == max_attempts - 1:
+      return resp
+    time.sleep(min(max_delay, base_delay * 2**attempt) + random.uniform(0, base_delay))
+
+
+CORS_HEADERS = {
+  "Access-Control-Allow-Origin": "*",
+  "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+  "Access-Control-Allow-Headers": "Content-Type, Authorization",
+}
+
+
+def require_api_key(view):
+  """Reject non-preflight requests with a 500 when no DashScope key is configured."""
+
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    if request.method != "OPTIONS" and not DASHSCOPE_API_KEY:
+      return jsonify({"error": "未配置 DASHSCOPE_API_KEY 环境变量"}), 500
+    return view(*args, **kwargs)
+
+  return wrapper
+
+
 @app.after_request
 def add_cors_headers(response):
-  response.headers["Access-Control-Allow-Origin"] = "*"
-  response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-  response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+  response.headers.update(CORS_HEADERS)
   return response
 
 
 @app.route("/api/asr", methods=["POST"])
+@require_api_key
 def asr():
-  api_key = "sk-dfb5d9295ee94adeafc438d18c7d4900"
-  if not api_key:
-    return jsonify({"error": "未配置 DASHSCOPE_API_KEY 环境变量"}), 500
-
   payload = request.get_json(silent=True) or {}
   audio_base64 = payload.get("audioBase64")
   fmt = payload.get("format", "webm")
@@ -63,12 +143,14 @@ def asr():
   ]
 
   try:
-    resp = MultiModalConversation.call(
-      api_key=api_key,
-      model="qwen3-asr-flash",
-      messages=messages,
-      result_format="message",
-      asr_options={"enable_lid": True, "enable_itn": False},
+    resp = call_with_retry(
+      lambda: MultiModalConversation.call(
+        api_key=DASHSCOPE_API_KEY,
+        model=ASR_MODEL,
+        messages=messages,
+        result_format="message",
+        asr_options={"enable_lid": True, "enable_itn": False},
+      )
     )
   except Exception as exc:  # noqa: BLE001
     return jsonify({"error": f"调用 DashScope 失败: {exc}"}), 500
@@ -89,19 +171,15 @@ def asr():
 
 
 @app.route("/api/diagnose", methods=["POST", "OPTIONS"])
+@require_api_key
 def diagnose():
   if request.method == "OPTIONS":
     return ("", 204)
-  api_key = "sk-dfb5d9295ee94adeafc438d18c7d4900"
-  if not api_key:
-    return jsonify({"error": "未配置 DASHSCOPE_API_KEY 环境变量"}), 500
-
   payload = request.get_json(silent=True) or {}
   answers = payload.get("answers")
-  if not isinstance(answers, list) or len(answers) == 0:
+  if not isinstance(answers, list) or not answers:
     return jsonify({"error": "缺少回答内容"}), 400
 
-  prompt = "你是语法检测人员，帮忙找语法/用词问题并给出简短建议。输出每题：问题类型、问题解析（最多3条，简明短句），总体建议一段，最后给一个最终修改之后的答案，叫做‘答案’。格式用Markdown。"
   content_lines = []
   for idx, item in enumerate(answers, start=1):
     question = item.get("question", "")
@@ -109,66 +187,28 @@ def diagnose():
     content_lines.append(f"{idx}. 问题：{question}\n回答：{answer}")
   user_content = "\n\n".join(content_lines)
 
-  client = OpenAI(
-    api_key=api_key,
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-  )
   try:
-    completion = client.chat.completions.create(
-      model="qwen-flash",
-      messages=[
-        {"role": "system", "content": prompt},
-        {"role": "user", "content": user_content},
-      ],
-      extra_body={"enable_thinking": True},
-      stream=False,
-    )
-    text = completion.choices[0].message.content
+    text = chat_completion(DASHSCOPE_API_KEY, DIAGNOSE_PROMPT, user_content, extra_body={"enable_thinking": True})
     return jsonify({"text": text})
   except Exception as exc:  # noqa: BLE001
     return jsonify({"error": f"调用大模型失败: {exc}"}), 500
 
 
 @app.route("/api/gram-check", methods=["POST", "OPTIONS"])
+@require_api_key
 def gram_check():
   if request.method == "OPTIONS":
     return ("", 204)
-  api_key = "sk-dfb5d9295ee94adeafc438d18c7d4900"
-  if not api_key:
-    return jsonify({"error": "未配置 DASHSCOPE_API_KEY 环境变量"}), 500
-
   payload = request.get_json(silent=True) or {}
   question = payload.get("question") or ""
   answer = payload.get("answer") or ""
   if not answer.strip():
     return jsonify({"error": "缺少回答内容"}), 400
 
-  prompt = (
-    "请作为HSKK口语考官，用中文检查回答的语法/用词问题。"
-    "务必只输出严格的JSON对象，字段包括："
-    "“问题” (回答的原文), “问题类型” (概括错误类别，如语法/用词/结构/流畅度)，"
-    "“问题解析” (简短说明错误点并给出如何改进), “优化表达” (给出修改后的更自然答案)。"
-    "不要输出多余文本。"
-  )
-
-  client = OpenAI(
-    api_key=api_key,
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-  )
   try:
-    completion = client.chat.completions.create(
-      model="qwen-flash",
-      messages=[
-        {"role": "system", "content": prompt},
-        {"role": "user", "content": f"题目：{question}\n回答：{answer}"},
-      ],
-      stream=False,
-    )
-    text = completion.choices[0].message.content
+    text = chat_completion(DASHSCOPE_API_KEY, GRAM_CHECK_PROMPT, f"题目：{question}\n回答：{answer}")
     # Try parse JSON; if fail, return raw text
     try:
-      import json
-
       parsed = json.loads(text)
     except Exception:
       parsed = None